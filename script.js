@@ -5,7 +5,7 @@
 // Config
 // =========================
 // Auto switch:
-// - Local dev: Flask on http://127.0.0.1:5000
+// - Local dev: uvicorn on http://127.0.0.1:5000
 // - Deployed frontend (GitHub Pages): backend on Render (https)
 const API_BASE = "";
 
@@ -115,10 +115,15 @@ async function getChatGPTReply(message) {
         buffer = events.pop() || "";
 
         for (const event of events) {
-          const line = event.trim();
-          if (!line.startsWith("data:")) continue;
-
-          const data = line.slice(5).trim();
+          // An event may span several "data:" lines; per the SSE spec they are
+          // joined with "\n" and only the single space after "data:" is dropped
+          const dataLines = event
+            .split("\n")
+            .filter((line) => line.startsWith("data:"))
+            .map((line) => line.slice(line.startsWith("data: ") ? 6 : 5));
+          if (dataLines.length === 0) continue;
+
+          const data = dataLines.join("\n");
           if (data === "[DONE]") return fullText;
 
           fullText += data;
@@ -1,17 +1,55 @@
 from __future__ import annotations
 
+import asyncio
+import gzip
+import hashlib
+import mimetypes
 import os
+import re
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
 
-import pytz
-import requests
-from flask import Flask, Response, jsonify, request, send_from_directory
-from flask_cors import CORS
+import httpx
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from google import genai
 
 # Serve UI from repo root (index.html, script.js, style.css)
-app = Flask(__name__, static_folder="..", static_url_path="")
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Shared async HTTP client for upstream APIs (Open-Meteo): keeps the TLS
+# connection alive between fetches and retries failed connects
+_http = httpx.AsyncClient(
+    timeout=10,
+    # Limits live on the transport: httpx ignores client-level limits= when one is passed
+    transport=httpx.AsyncHTTPTransport(
+        retries=2, limits=httpx.Limits(max_connections=8, max_keepalive_connections=2)
+    ),
+)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    yield
+    await _http.aclose()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+MODEL = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
 
 _client = None
 
@@ -32,113 +70,354 @@ def get_gemini_client() -> genai.Client:
     return _client
 
 
+MAX_MESSAGE_CHARS = 8192
+
+
+class MessageError(Exception):
+    """Invalid chat request body; rendered as {"error": ...} with status_code."""
+
+    def __init__(self, error: str, status_code: int = 400):
+        super().__init__(error)
+        self.error = error
+        self.status_code = status_code
+
+
+@app.exception_handler(MessageError)
+async def message_error(_request: Request, exc: MessageError):
+    return ORJSONResponse({"error": exc.error}, status_code=exc.status_code)
+
+
+async def read_message(request: Request) -> str:
+    """
+    Return the stripped 'message' field of a JSON body.
+    Raises MessageError (400) if it is absent/invalid, or (413) if too long.
+    """
+    msg = None
+    # Empty body: answer without reading or parsing anything
+    headers = request.headers
+    if headers.get("content-length") != "0" and (
+        "content-length" in headers or "transfer-encoding" in headers
+    ):
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict):
+            msg = payload.get("message")
+
+    msg = msg.strip() if isinstance(msg, str) else ""
+    if not msg:
+        raise MessageError("Missing 'message'")
+    if len(msg) > MAX_MESSAGE_CHARS:
+        raise MessageError(f"Message too long (max {MAX_MESSAGE_CHARS} characters)", 413)
+    return msg
+
+
 # --- Simple weather helper (Open-Meteo is free) ---
+_GALWAY_TZ = ZoneInfo("Europe/Dublin")
+_TIME_FMT = "%A, %d %B %Y %H:%M (%Z)"
+_WEATHER_TTL = 60.0
+_WEATHER_STALE = 300.0
 _weather_cache = {"ts": 0.0, "value": None}
+_weather_inflight: asyncio.Task | None = None
+
+# Galway coordinates; the query never changes so it is encoded once here
+_WEATHER_URL = (
+    "https://api.open-meteo.com/v1/forecast"
+    "?latitude=53.2707&longitude=-9.0568"
+    "&current=temperature_2m,precipitation,wind_speed_10m"
+    "&timezone=Europe/Dublin"
+)
 
-def get_galway_time_and_weather() -> dict:
-    tz = pytz.timezone("Europe/Dublin")
-    now = datetime.now(tz)
-
-    # Galway coordinates
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": 53.2707,
-        "longitude": -9.0568,
-        "current": "temperature_2m,precipitation,wind_speed_10m",
-        "timezone": "Europe/Dublin",
+async def _fetch_weather() -> dict:
+    r = await _http.get(_WEATHER_URL)
+    r.raise_for_status()
+    data = orjson.loads(r.content)
+    cur = data.get("current") or {}
+    value = {
+        "temperature_c": cur.get("temperature_2m"),
+        "wind_kmh": cur.get("wind_speed_10m"),
+        "precip_mm": cur.get("precipitation"),
     }
+    _weather_cache["ts"] = time.monotonic()
+    _weather_cache["value"] = value
+    return value
+
+
+def _clear_weather_inflight(task: asyncio.Task) -> None:
+    global _weather_inflight
+    _weather_inflight = None
+    if not task.cancelled():
+        task.exception()  # mark as retrieved even if every waiter went away
+
+
+async def galway_weather_now() -> dict:
+    """
+    Current Galway weather, cached for _WEATHER_TTL seconds.
+    For a further _WEATHER_STALE seconds the old value is served immediately
+    while a background refresh runs. Concurrent misses share one request.
+    """
+    global _weather_inflight
+    value = _weather_cache["value"]
+    age = time.monotonic() - _weather_cache["ts"]
+    if value is not None and age < _WEATHER_TTL:
+        return value
+
+    if _weather_inflight is None:
+        _weather_inflight = asyncio.create_task(_fetch_weather())
+        _weather_inflight.add_done_callback(_clear_weather_inflight)
 
+    if value is not None and age < _WEATHER_TTL + _WEATHER_STALE:
+        return value
+    # Shield so one disconnecting client doesn't cancel the fetch for the others
+    return await asyncio.shield(_weather_inflight)
+
+
+_time_cache: tuple[int, str] = (-1, "")
+
+def galway_time_now() -> str:
+    """Formatted Galway local time, re-rendered at most once per minute."""
+    global _time_cache
+    bucket = int(time.time() // 60)
+    if bucket != _time_cache[0]:
+        _time_cache = (bucket, datetime.now(_GALWAY_TZ).strftime(_TIME_FMT))
+    return _time_cache[1]
+
+
+async def get_galway_time_and_weather() -> dict:
     try:
-        r = requests.get(url, params=params, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        cur = data.get("current") or {}
-        return {
-            "time": now.strftime("%A, %d %B %Y %H:%M (%Z)"),
-            "temperature_c": cur.get("temperature_2m"),
-            "wind_kmh": cur.get("wind_speed_10m"),
-            "precip_mm": cur.get("precipitation"),
-        }
+        weather = await galway_weather_now()
     except Exception:
         # Still return time even if weather fails
-        return {
-            "time": now.strftime("%A, %d %B %Y %H:%M (%Z)"),
-            "temperature_c": None,
-            "wind_kmh": None,
-            "precip_mm": None,
-        }
+        weather = {"temperature_c": None, "wind_kmh": None, "precip_mm": None}
+
+    return {"time": galway_time_now(), **weather}
+
+
+# Prompt with live tool info; filled from get_galway_time_and_weather() + user_msg
+_PROMPT_TEMPLATE = (
+    "Galway time now: {time}\n"
+    "Weather: temp={temperature_c}C wind={wind_kmh}km/h precip={precip_mm}mm\n"
+    "\n"
+    "User: {user_msg}\n"
+    "Assistant:"
+)
+
+# Messages that should get live time/weather data (single case-insensitive pass)
+_LIVE_DATA_RE = re.compile(r"\b(time|weather|galway|ireland)\b", re.IGNORECASE)
+
+def needs_live_data(user_msg: str) -> bool:
+    """True when the message asks about time or weather *and* names Galway/Ireland."""
+    hits = {m.group(1).lower() for m in _LIVE_DATA_RE.finditer(user_msg)}
+    return bool(hits & {"time", "weather"}) and bool(hits & {"galway", "ireland"})
+
+
+async def build_prompt(user_msg: str) -> str:
+    if not needs_live_data(user_msg):
+        return user_msg  # no tool info, so no need for the User/Assistant wrapper
+    tw = await get_galway_time_and_weather()
+    return _PROMPT_TEMPLATE.format_map({**tw, "user_msg": user_msg})
+
+
+async def stream_text(client: genai.Client, model: str, prompt: str) -> AsyncIterator[str]:
+    """Yield the non-empty text fragments of a Gemini streaming response."""
+    stream = await client.aio.models.generate_content_stream(model=model, contents=prompt)
+    async for chunk in stream:
+        t = chunk.text  # GenerateContentResponse.text is None for non-text chunks
+        if t:
+            yield t
+
+
+async def coalesce(
+    fragments: AsyncIterator[str], max_chars: int = 256, max_delay: float = 0.016
+) -> AsyncIterator[str]:
+    """
+    Merge small fragments into fewer, larger ones. Buffered text is released once
+    it reaches max_chars or has waited max_delay seconds, whichever comes first.
+    """
+    it = aiter(fragments)
+    pending = None
+    buf: list[str] = []
+    size = 0
+    deadline = 0.0
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(anext(it))
+            if buf:
+                done, _ = await asyncio.wait((pending,), timeout=deadline - time.monotonic())
+                if not done:
+                    yield "".join(buf)
+                    buf.clear()
+                    size = 0
+                    continue
+            try:
+                t = await pending
+            except StopAsyncIteration:
+                break
+            except Exception:
+                if buf:
+                    yield "".join(buf)  # don't drop text received before the error
+                raise
+            finally:
+                pending = None
+            if not buf:
+                deadline = time.monotonic() + max_delay
+            buf.append(t)
+            size += len(t)
+            if size >= max_chars:
+                yield "".join(buf)
+                buf.clear()
+                size = 0
+        if buf:
+            yield "".join(buf)
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+# Pre-encoded SSE frames; the stream yields bytes so nothing is re-encoded per chunk
+_SSE_DONE = b"data: [DONE]\n\n"
+
+
+def sse_frame(text: str) -> bytes:
+    """
+    Encode text as one SSE event. Each line gets its own "data:" field, so
+    newlines in the text can't end the event early; clients rejoin with "\n".
+    """
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").encode().split(b"\n")
+    return b"data: " + b"\ndata: ".join(lines) + b"\n\n"
+
+
+# Health body never changes, so probes can revalidate (304) or reuse it for a second
+_HEALTH_BODY = b'{"status":"ok"}'
+_HEALTH_HEADERS = {"Cache-Control": "public, max-age=1", "ETag": '"ok"'}
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check: tag lists, "*" and weak (W/) tags all count (RFC 9110)."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (t.removeprefix("W/") for t in tags)
 
 
 @app.get("/api/health")
-def health():
+async def health(request: Request):
     # Always works even with no key (important for CI)
-    return jsonify({"status": "ok"})
+    if etag_matches(request, _HEALTH_HEADERS["ETag"]):
+        return Response(status_code=304, headers=_HEALTH_HEADERS)
+    return Response(_HEALTH_BODY, media_type="application/json", headers=_HEALTH_HEADERS)
 
 
-@app.get("/")
-def root():
-    return send_from_directory("..", "index.html")
+# Recent /api/chat replies keyed by (model, prompt hash). Live-data prompts embed
+# the current minute, so those entries stop matching once the time moves on.
+_reply_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
 
 
 @app.post("/api/chat")
-def chat():
-    payload = request.get_json(silent=True) or {}
-    user_msg = (payload.get("message") or "").strip()
-    if not user_msg:
-        return jsonify({"error": "Missing 'message'"}), 400
-
-    # Add your “Galway time/weather” tool info into prompt
-    tw = get_galway_time_and_weather()
-    tool_context = (
-        f"Galway time now: {tw['time']}\n"
-        f"Weather: temp={tw['temperature_c']}C wind={tw['wind_kmh']}km/h precip={tw['precip_mm']}mm\n"
-    )
+async def chat(request: Request):
+    user_msg = await read_message(request)
+
+    # Add your “Galway time/weather” tool info into prompt when asked about it
+    prompt = await build_prompt(user_msg)
 
     try:
         client = get_gemini_client()
     except RuntimeError as e:
-        return jsonify({"error": str(e)}), 500
-
-    model = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
-
-    prompt = f"{tool_context}\nUser: {user_msg}\nAssistant:"
+        return ORJSONResponse({"error": str(e)}, status_code=500)
 
-    resp = client.models.generate_content(model=model, contents=prompt)
-    text = getattr(resp, "text", None) or str(resp)
+    key = (MODEL, hashlib.blake2b(prompt.encode(), digest_size=16).digest())
+    cached = _reply_cache.get(key)
+    if cached is not None:
+        return ORJSONResponse({"reply": cached})
 
-    return jsonify({"reply": text})
+    # Same streaming call as /api/chat/stream, buffered into a single reply
+    text = "".join([t async for t in stream_text(client, MODEL, prompt)])
+    if text:
+        _reply_cache[key] = text
+    return ORJSONResponse({"reply": text})
 
 
 @app.post("/api/chat/stream")
-def chat_stream():
-    payload = request.get_json(silent=True) or {}
-    user_msg = (payload.get("message") or "").strip()
-    if not user_msg:
-        return jsonify({"error": "Missing 'message'"}), 400
-
-    tw = get_galway_time_and_weather()
-    tool_context = (
-        f"Galway time now: {tw['time']}\n"
-        f"Weather: temp={tw['temperature_c']}C wind={tw['wind_kmh']}km/h precip={tw['precip_mm']}mm\n"
-    )
+async def chat_stream(request: Request):
+    user_msg = await read_message(request)
+
+    prompt = await build_prompt(user_msg)
 
     try:
         client = get_gemini_client()
     except RuntimeError as e:
-        return jsonify({"error": str(e)}), 500
-
-    model = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
-    prompt = f"{tool_context}\nUser: {user_msg}\nAssistant:"
+        return ORJSONResponse({"error": str(e)}, status_code=500)
 
-    def generate():
+    async def sse():
         # SSE (Server-Sent Events)
         try:
-            stream = client.models.generate_content_stream(model=model, contents=prompt)
-            for chunk in stream:
-                t = getattr(chunk, "text", "")
-                if t:
-                    yield f"data: {t}\n\n"
+            async for t in coalesce(stream_text(client, MODEL, prompt)):
+                yield sse_frame(t)
+            yield _SSE_DONE
         except Exception as e:
-            yield f"data: [ERROR] {str(e)}\n\n"
+            yield sse_frame(f"[ERROR] {e}")
+
+    return StreamingResponse(sse(), media_type="text/event-stream")
+
+
+# --- UI assets ---
+# Only the UI files are served. Each is read, gzipped and hashed once at import,
+# so a page load is a dict lookup (restart to pick up edits). Missing files are
+# skipped for API-only deploys where the UI is hosted elsewhere.
+_UI_FILES = ("index.html", "script.js", "style.css")
+
+def _load_ui_assets() -> dict[str, tuple[bytes, bytes, str, str, str]]:
+    assets = {}
+    for name in _UI_FILES:
+        path = ROOT_DIR / name
+        if not path.is_file():
+            continue
+        body = path.read_bytes()
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        digest = hashlib.md5(body, usedforsecurity=False).hexdigest()
+        # Each encoding is its own representation, so it gets its own strong ETag
+        assets[name] = (body, gzip.compress(body), media_type, f'"{digest}"', f'"{digest}-gz"')
+    return assets
+
+
+_ui_assets = _load_ui_assets()
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip (q > 0), by name or via "*"."""
+    q_by_coding = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        q_by_coding[coding.strip().lower()] = q
+    return q_by_coding.get("gzip", q_by_coding.get("*", 0.0)) > 0
+
+
+@app.api_route("/", methods=["GET", "HEAD"])
+@app.api_route("/{name}", methods=["GET", "HEAD"])
+async def ui_asset(request: Request, name: str = "index.html"):
+    asset = _ui_assets.get(name)
+    if asset is None:
+        raise HTTPException(status_code=404)
+    body, gz_body, media_type, etag, gz_etag = asset
+
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": "public, max-age=300"}
+    if _accepts_gzip(request.headers.get("accept-encoding", "")):
+        headers["Content-Encoding"] = "gzip"
+        body, etag = gz_body, gz_etag
+    headers["ETag"] = etag
 
-    return Response(generate(), mimetype="text/event-stream")
+    if etag_matches(request, etag):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
@@ -0,0 +1,243 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import server.app as app_module
+
+
+@pytest.fixture
+def weather_calls(monkeypatch):
+    """Route Open-Meteo through a MockTransport and start from a cold cache."""
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"current": {"temperature_2m": len(calls)}})
+
+    monkeypatch.setattr(app_module, "_http", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(app_module, "_weather_cache", {"ts": 0.0, "value": None})
+    monkeypatch.setattr(app_module, "_weather_inflight", None)
+    return calls
+
+
+def test_weather_cold_misses_share_one_fetch(weather_calls):
+    async def run():
+        return await asyncio.gather(*[app_module.galway_weather_now() for _ in range(50)])
+
+    results = asyncio.run(run())
+    assert len(weather_calls) == 1
+    assert all(r["temperature_c"] == 1 for r in results)
+
+
+def test_weather_stale_served_while_one_refresh_runs(weather_calls):
+    async def run():
+        await app_module.galway_weather_now()
+        app_module._weather_cache["ts"] -= app_module._WEATHER_TTL + 1
+
+        stale, refreshes = [], set()
+        for _ in range(10):
+            stale.append(await app_module.galway_weather_now())
+            refreshes.add(app_module._weather_inflight)
+        assert len(refreshes) == 1
+        await refreshes.pop()
+        return stale, await app_module.galway_weather_now()
+
+    stale, fresh = asyncio.run(run())
+    assert all(r["temperature_c"] == 1 for r in stale)
+    assert len(weather_calls) == 2
+    assert fresh["temperature_c"] == 2
+
+
+async def fragments(items, delay=0.0, error=None):
+    for item in items:
+        await asyncio.sleep(delay)
+        yield item
+    if error is not None:
+        raise error
+
+
+async def collect(agen):
+    return [part async for part in agen]
+
+
+def test_coalesce_flushes_by_size():
+    parts = asyncio.run(collect(app_module.coalesce(fragments(["ab"] * 10), max_chars=6, max_delay=10)))
+    assert parts == ["ababab", "ababab", "ababab", "ab"]
+
+
+def test_coalesce_flushes_by_deadline():
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        agen = app_module.coalesce(fragments(["a", "b"], delay=0.2), max_delay=0.02)
+        first = await anext(agen)
+        elapsed = loop.time() - start
+        await agen.aclose()
+        return first, elapsed
+
+    first, elapsed = asyncio.run(run())
+    # "a" goes out after the deadline instead of waiting for "b"
+    assert first == "a"
+    assert elapsed < 0.35  # "b" only arrives at ~0.4s
+
+
+def test_coalesce_keeps_text_before_upstream_error():
+    seen = []
+
+    async def run():
+        async for part in app_module.coalesce(fragments(["a", "b"], error=ValueError("boom"))):
+            seen.append(part)
+
+    with pytest.raises(ValueError, match="boom"):
+        asyncio.run(run())
+    assert "".join(seen) == "ab"
+
+
+def test_health_revalidates_with_304():
+    with TestClient(app_module.app) as client:
+        r = client.get("/api/health")
+        assert r.status_code == 200
+        assert r.json() == {"status": "ok"}
+        assert r.headers["cache-control"] == "public, max-age=1"
+
+        r = client.get("/api/health", headers={"If-None-Match": r.headers["etag"]})
+        assert r.status_code == 304
+        assert r.content == b""
+
+
+@pytest.mark.parametrize(
+    ("msg", "expected"),
+    [
+        ("time in ireland", True),
+        ("What's the weather like in Galway?", True),
+        ("WEATHER in IRELAND", True),
+        ("What's the time?", False),
+        ("time complexity", False),
+        ("Set a timer", False),
+        ("times in galway", False),
+        ("Tell me about Ireland history", False),
+    ],
+)
+def test_needs_live_data(msg, expected):
+    assert app_module.needs_live_data(msg) is expected
+
+
+def parse_sse(raw: bytes) -> list[str]:
+    """Decode SSE events the way script.js pump() does."""
+    events = []
+    for event in raw.decode().split("\n\n")[:-1]:
+        lines = [ln for ln in event.split("\n") if ln.startswith("data:")]
+        events.append("\n".join(ln[6:] if ln.startswith("data: ") else ln[5:] for ln in lines))
+    return events
+
+
+@pytest.mark.parametrize("text", ["plain", "para one.\n\npara two", "ends with break\n\n", " lead space", "a\r\nb"])
+def test_sse_frame_round_trips_newlines(text):
+    assert parse_sse(app_module.sse_frame(text)) == [text.replace("\r\n", "\n")]
+
+
+def test_ui_asset_etag_per_encoding_and_304():
+    with TestClient(app_module.app) as client:
+        gz = client.get("/", headers={"Accept-Encoding": "gzip"})
+        plain = client.get("/", headers={"Accept-Encoding": "identity"})
+        assert gz.headers["content-encoding"] == "gzip"
+        assert "content-encoding" not in plain.headers
+        assert gz.headers["etag"] != plain.headers["etag"]
+        assert gz.content == plain.content
+
+        r = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": gz.headers["etag"]})
+        assert r.status_code == 304
+        # The identity tag doesn't validate the gzip representation
+        r = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": plain.headers["etag"]})
+        assert r.status_code == 200
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "expected"),
+    [
+        ("gzip", True),
+        ("gzip, deflate, br", True),
+        ("br;q=1.0, gzip;q=0.5", True),
+        ("*", True),
+        ("gzip;q=0", False),
+        ("*, gzip;q=0", False),
+        ("identity", False),
+        ("", False),
+    ],
+)
+def test_accepts_gzip(accept_encoding, expected):
+    assert app_module._accepts_gzip(accept_encoding) is expected
+
+
+def test_ui_asset_only_serves_ui_files():
+    with TestClient(app_module.app) as client:
+        assert client.get("/.env").status_code == 404
+        assert client.get("/requirements.txt").status_code == 404
+        assert client.head("/").status_code == 200
+
+
+class FakeGemini:
+    """Stands in for genai.Client; streams fixed text fragments."""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.aio = self
+        self.models = self
+
+    async def generate_content_stream(self, model, contents):
+        return fragments([type("Chunk", (), {"text": t})() for t in self.texts])
+
+
+def test_chat_stream_keeps_text_after_paragraph_breaks(monkeypatch):
+    texts = ["First paragraph.\n\n", "Second paragraph ", "continues here."]
+    monkeypatch.setattr(app_module, "_client", FakeGemini(texts))
+
+    with TestClient(app_module.app) as client:
+        r = client.post("/api/chat/stream", json={"message": "hello"})
+
+    events = parse_sse(r.content)
+    assert events[-1] == "[DONE]"
+    assert "".join(events[:-1]) == "".join(texts)
+
+
+@pytest.mark.parametrize("if_none_match", ['"ok"', 'W/"ok"', '"other", "ok"', "*"])
+def test_health_304_for_matching_if_none_match(if_none_match):
+    with TestClient(app_module.app) as client:
+        r = client.get("/api/health", headers={"If-None-Match": if_none_match})
+    assert r.status_code == 304
+
+
+def test_health_200_for_other_etag():
+    with TestClient(app_module.app) as client:
+        r = client.get("/api/health", headers={"If-None-Match": '"other"'})
+    assert r.status_code == 200
+
+
+@pytest.mark.parametrize("path", ["/api/chat", "/api/chat/stream"])
+@pytest.mark.parametrize(
+    "body",
+    [
+        {},
+        {"content": b""},
+        {"content": b"{not json"},
+        {"json": ["message"]},
+        {"json": {"message": 5}},
+        {"json": {"message": "   "}},
+    ],
+)
+def test_chat_rejects_missing_message(path, body):
+    with TestClient(app_module.app) as client:
+        r = client.post(path, **body)
+    assert r.status_code == 400
+    assert r.json() == {"error": "Missing 'message'"}
+
+
+@pytest.mark.parametrize("path", ["/api/chat", "/api/chat/stream"])
+def test_chat_rejects_oversized_message(path):
+    with TestClient(app_module.app) as client:
+        r = client.post(path, json={"message": "x" * (app_module.MAX_MESSAGE_CHARS + 1)})
+    assert r.status_code == 413
+    assert "error" in r.json()